@@ -9,11 +9,11 @@ from pathlib import Path
 project_root = Path(__file__).parent
 sys.path.append(str(project_root))
 
-from src.generators.image_generator import ImageGenerator
+from src.generators.image_generator import ImageGenerator, is_gpu_busy, MAX_IMAGES_PER_PROMPT
 from src.generators.video_generator import VideoGenerator
 from src.utils.file_manager import FileManager
-from src.ui.components import UIComponents
-from config.config import Config
+from src.ui.components import UIComponents, get_thumbnail
+from config.config import get_config
 
 # Page configuration
 st.set_page_config(
@@ -23,6 +23,15 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Cached generators: built once per provider and shared across reruns and sessions
+@st.cache_resource(show_spinner=False)
+def get_image_generator(provider: str) -> ImageGenerator:
+    return ImageGenerator(provider)
+
+@st.cache_resource(show_spinner=False)
+def get_video_generator(provider: str) -> VideoGenerator:
+    return VideoGenerator(provider)
+
 # Custom CSS
 def load_css():
     css_path = Path("static/css/style.css")
@@ -47,7 +56,7 @@ def main():
     init_session_state()
 
     # Initialize components
-    config = Config()
+    config = get_config()
     file_manager = FileManager()
     ui_components = UIComponents()
 
@@ -78,6 +87,12 @@ def main():
         if generation_type == "Image Generation":
             image_size = st.selectbox("Image Size", ["512x512", "1024x1024", "1024x1792"])
             image_quality = st.slider("Quality", 1, 100, 80)
+            inference_steps = 20
+            if provider == "Local Diffusion":
+                inference_steps = st.slider(
+                    "Inference Steps", 10, 50, 20,
+                    help="Fewer steps generate faster; more steps can add detail"
+                )
         elif generation_type in ["Video Generation", "Image to Video"]:
             video_duration = st.slider("Duration (seconds)", 3, 30, 5)
             video_fps = st.selectbox("FPS", [24, 30, 60], index=1)
@@ -105,7 +120,7 @@ def main():
 
             col_img1, col_img2 = st.columns(2)
             with col_img1:
-                num_images = st.slider("Number of images", 1, 4, 1)
+                num_images = st.slider("Number of images", 1, MAX_IMAGES_PER_PROMPT, 1)
             with col_img2:
                 seed = st.number_input("Seed (optional)", value=0, help="Use 0 for random")
 
@@ -141,29 +156,26 @@ def main():
         # Generate button
         if st.button("🚀 Generate", type="primary", use_container_width=True):
             if generation_type == "Image Generation" and prompt:
-                generate_images(prompt, negative_prompt, provider, num_images, seed, image_size, image_quality)
+                generate_images(prompt, negative_prompt, provider, num_images, seed, image_size, image_quality, inference_steps)
             elif generation_type == "Video Generation" and prompt:
                 generate_video(prompt, provider, video_duration, video_fps, video_resolution, style)
             elif generation_type == "Image to Video" and uploaded_image and motion_prompt:
                 generate_video_from_image(uploaded_image, motion_prompt, provider, video_duration, video_fps, video_resolution)
 
     with col2:
-        # Generation history and gallery
-        st.subheader("📚 Generation History")
-
-        if st.session_state.generation_history:
-            for i, item in enumerate(reversed(st.session_state.generation_history[-10:])):
-                with st.expander(f"{item['type']} - {item['timestamp']}", expanded=i==0):
-                    st.write(f"**Prompt:** {item['prompt']}")
-                    st.write(f"**Provider:** {item['provider']}")
-                    if item['type'] == 'Image':
-                        st.image(item['path'], use_column_width=True)
-                    else:
-                        st.video(item['path'])
-        else:
-            st.info("No generations yet. Start creating!")
+        render_history()
 
-    # Gallery section
+    render_gallery()
+
+# Fragments rerun on their own when their widgets change, without rerunning main()
+@st.fragment
+def render_history():
+    """Render the generation history panel"""
+    UIComponents().render_generation_history(st.session_state.generation_history)
+
+@st.fragment
+def render_gallery():
+    """Render the image and video gallery"""
     st.subheader("🖼️ Gallery")
 
     tabs = st.tabs(["Images", "Videos"])
@@ -174,7 +186,7 @@ def main():
             for i, img_path in enumerate(st.session_state.generated_images):
                 with cols[i % 3]:
                     if os.path.exists(img_path):
-                        st.image(img_path, use_column_width=True)
+                        st.image(get_thumbnail(img_path, os.path.getmtime(img_path)), use_column_width=True)
                         if st.button(f"Download", key=f"download_img_{i}"):
                             download_file(img_path)
         else:
@@ -190,17 +202,20 @@ def main():
         else:
             st.info("No videos generated yet.")
 
-def generate_images(prompt, negative_prompt, provider, num_images, seed, size, quality):
+def generate_images(prompt, negative_prompt, provider, num_images, seed, size, quality, inference_steps=20):
     """Generate images using the selected provider"""
     progress_bar = st.progress(0)
     status_text = st.empty()
 
     try:
         status_text.text("Initializing image generator...")
-        image_generator = ImageGenerator(provider)
+        image_generator = get_image_generator(provider)
 
         progress_bar.progress(25)
-        status_text.text("Generating images...")
+        if provider == "Local Diffusion" and is_gpu_busy():
+            status_text.text("⏳ Waiting for the GPU — another generation is in progress...")
+        else:
+            status_text.text("Generating images...")
 
         images = image_generator.generate(
             prompt=prompt,
@@ -208,7 +223,8 @@ def generate_images(prompt, negative_prompt, provider, num_images, seed, size, q
             num_images=num_images,
             seed=seed if seed != 0 else None,
             size=size,
-            quality=quality
+            quality=quality,
+            num_inference_steps=inference_steps
         )
 
         progress_bar.progress(75)
@@ -217,9 +233,9 @@ def generate_images(prompt, negative_prompt, provider, num_images, seed, size, q
         file_manager = FileManager()
         saved_paths = []
 
-        for i, image in enumerate(images):
-            filename = f"image_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{i+1}.png"
-            path = file_manager.save_image(image, filename)
+        for image in images:
+            # Default names are unique per call, so quick repeats never overwrite earlier files
+            path = file_manager.save_image(image)
             saved_paths.append(path)
             st.session_state.generated_images.append(path)
 
@@ -242,12 +258,15 @@ def generate_images(prompt, negative_prompt, provider, num_images, seed, size, q
             with cols[i % len(cols)]:
                 st.image(image, use_column_width=True)
                 if os.path.exists(path):
-                    st.download_button(
-                        label="Download",
-                        data=open(path, 'rb').read(),
-                        file_name=f"generated_image_{i+1}.png",
-                        mime="image/png"
-                    )
+                    # Streamlit still reads the whole file into memory when the button
+                    # is built; the with block only makes sure the handle is closed
+                    with open(path, 'rb') as f:
+                        st.download_button(
+                            label="Download",
+                            data=f,
+                            file_name=f"generated_image_{i+1}.png",
+                            mime="image/png"
+                        )
 
     except Exception as e:
         st.error(f"Error generating images: {str(e)}")
@@ -262,7 +281,7 @@ def generate_video(prompt, provider, duration, fps, resolution, style):
 
     try:
         status_text.text("Initializing video generator...")
-        video_generator = VideoGenerator(provider)
+        video_generator = get_video_generator(provider)
 
         progress_bar.progress(25)
         status_text.text("Generating video (this may take several minutes)...")
@@ -300,7 +319,7 @@ def generate_video(prompt, provider, duration, fps, resolution, style):
             with open(video_path, 'rb') as f:
                 st.download_button(
                     label="Download Video",
-                    data=f.read(),
+                    data=f,
                     file_name="generated_video.mp4",
                     mime="video/mp4"
                 )
@@ -326,7 +345,7 @@ def generate_video_from_image(uploaded_image, motion_prompt, provider, duration,
         progress_bar.progress(25)
         status_text.text("Generating video from image...")
 
-        video_generator = VideoGenerator(provider)
+        video_generator = get_video_generator(provider)
         video_path = video_generator.image_to_video(
             image_path=temp_image_path,
             motion_prompt=motion_prompt,
@@ -360,7 +379,7 @@ def generate_video_from_image(uploaded_image, motion_prompt, provider, duration,
             with open(video_path, 'rb') as f:
                 st.download_button(
                     label="Download Video",
-                    data=f.read(),
+                    data=f,
                     file_name="generated_video.mp4",
                     mime="video/mp4"
                 )
@@ -376,10 +395,9 @@ def download_file(file_path):
     try:
         if os.path.exists(file_path):
             with open(file_path, 'rb') as f:
-                file_bytes = f.read()
                 st.download_button(
                     label="Download",
-                    data=file_bytes,
+                    data=f,
                     file_name=os.path.basename(file_path),
                     mime="application/octet-stream"
                 )
@@ -1,4 +1,5 @@
 import os
+import functools
 from dotenv import load_dotenv
 from pathlib import Path
 
@@ -21,11 +22,13 @@ class Config:
         self.IMAGES_DIR = self.GENERATED_DIR / "images"
         self.VIDEOS_DIR = self.GENERATED_DIR / "videos"
         self.TEMP_DIR = self.GENERATED_DIR / "temp"
+        self.IMAGE_CACHE_DIR = self.GENERATED_DIR / "cache"
 
         # Create directories if they don't exist
         self.IMAGES_DIR.mkdir(parents=True, exist_ok=True)
         self.VIDEOS_DIR.mkdir(parents=True, exist_ok=True)
         self.TEMP_DIR.mkdir(parents=True, exist_ok=True)
+        self.IMAGE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
 
         # Generation settings
         self.MAX_IMAGE_SIZE = 2048
@@ -34,7 +37,13 @@ class Config:
 
         # Model settings
         self.STABLE_DIFFUSION_MODEL = "runwayml/stable-diffusion-v1-5"
-        self.DEVICE = "cuda" if self._check_gpu() else "cpu"
+        # Optional UNet weight quantization for local diffusion ("int8" or unset)
+        self.LOCAL_QUANT = os.getenv('LOCAL_QUANT')
+
+    @property
+    def DEVICE(self) -> str:
+        """Device for local models, resolved on access so torch is only imported when needed"""
+        return "cuda" if self._check_gpu() else "cpu"
 
     def _check_gpu(self) -> bool:
         """Check if GPU is available"""
@@ -58,3 +67,8 @@ class Config:
             print("Please add them to your .env file for full functionality")
 
         return len(missing_keys) == 0
+
+@functools.lru_cache(maxsize=1)
+def get_config() -> Config:
+    """Return the shared Config instance, creating it on first use"""
+    return Config()
@@ -2,30 +2,75 @@ import os
 import requests
 import base64
 import time
+import math
+import queue
+import threading
+import multiprocessing
+import subprocess
+import shutil
+import functools
+import importlib.util
+from fractions import Fraction
 from typing import Optional
+from types import MappingProxyType
 import uuid
 from datetime import datetime
 from pathlib import Path
 
-try:
-    import cv2
-    import numpy as np
-    CV2_AVAILABLE = True
-except ImportError:
-    CV2_AVAILABLE = False
+# cv2, numpy and moviepy are imported on first use to keep app startup fast
+CV2_AVAILABLE = (importlib.util.find_spec("cv2") is not None
+                 and importlib.util.find_spec("numpy") is not None)
+MOVIEPY_AVAILABLE = importlib.util.find_spec("moviepy") is not None
+AV_AVAILABLE = importlib.util.find_spec("av") is not None
 
-try:
-    from moviepy.editor import VideoFileClip, ImageSequenceClip
-    MOVIEPY_AVAILABLE = True
-except ImportError:
-    MOVIEPY_AVAILABLE = False
+# H.264 encoders tried in order: NVIDIA, Intel Quick Sync, Apple VideoToolbox, then software
+H264_ENCODERS = ("h264_nvenc", "h264_qsv", "h264_videotoolbox", "libx264")
 
-from config.config import Config
+from config.config import get_config
+
+@functools.lru_cache(maxsize=None)
+def _select_h264_encoder() -> Optional[str]:
+    """Find the first H.264 encoder PyAV can open on this machine"""
+    import av
+
+    for name in H264_ENCODERS:
+        # Hardware encoders can be compiled in yet fail to open without the device
+        try:
+            ctx = av.CodecContext.create(name, "w")
+            ctx.width, ctx.height = 256, 256
+            ctx.pix_fmt = "yuv420p"
+            ctx.time_base = Fraction(1, 24)
+            ctx.open()
+            return name
+        except Exception:
+            continue
+    return None
+
+def _render_video_segment(args) -> str:
+    """Pool worker: render one time segment of a local text-to-video clip"""
+    segment_path, prompt, style, start, stop, total_frames, fps, width, height = args
+    VideoGenerator("Local Video")._render_frame_range(segment_path, prompt, style, start, stop,
+                                                      total_frames, fps, width, height)
+    return segment_path
 
 class VideoGenerator:
+    # Frames buffered between frame generation and the encoder thread
+    ENCODE_QUEUE_SIZE = 8
+    # Shortest time segment worth handing to a separate encoding process
+    MIN_SEGMENT_FRAMES = 48
+    # Most encoding processes per clip; each holds a frame ring and a multi-threaded encoder
+    MAX_SEGMENT_WORKERS = 4
+
+    RESOLUTION_MAP = MappingProxyType({
+        "720p": (1280, 720),
+        "1080p": (1920, 1080),
+        "4K": (3840, 2160),
+        "square": (1024, 1024)
+    })
+
     def __init__(self, provider: str):
         self.provider = provider
-        self.config = Config()
+        self.config = get_config()
 
         if provider == "RunwayML":
             if not self.config.RUNWAYML_API_SECRET:
@@ -66,33 +111,162 @@ class VideoGenerator:
         try:
             width, height = self._get_resolution_dimensions(resolution)
 
-            # Generate frame sequence
-            frames = []
             total_frames = duration * fps
-
-            for i in range(total_frames):
-                # Create animated frame based on prompt and style
-                frame = self._create_animated_frame(prompt, style, i, total_frames, width, height)
-                frames.append(frame)
-
-            # Create video from frames
             timestamp = int(time.time())
             video_path = self.config.VIDEOS_DIR / f"local_video_{timestamp}.mp4"
 
-            # Write video using OpenCV
-            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-            out = cv2.VideoWriter(str(video_path), fourcc, fps, (width, height))
-
-            for frame in frames:
-                out.write(frame)
-
-            out.release()
+            num_segments = min(os.cpu_count() or 1, self.MAX_SEGMENT_WORKERS,
+                               total_frames // self.MIN_SEGMENT_FRAMES)
+            ffmpeg = self._find_ffmpeg()
+            if num_segments > 1 and ffmpeg:
+                self._generate_local_video_parallel(video_path, ffmpeg, num_segments, prompt, style,
+                                                    total_frames, fps, width, height)
+            else:
+                self._render_frame_range(video_path, prompt, style, 0, total_frames,
+                                         total_frames, fps, width, height)
 
             return str(video_path)
 
         except Exception as e:
             raise Exception(f"Local video generation failed: {str(e)}")
 
+    def _render_frame_range(self, video_path, prompt: str, style: str, start: int, stop: int,
+                            total_frames: int, fps: int, width: int, height: int):
+        """Render and encode frames [start, stop) of an animated clip"""
+        import numpy as np
+
+        # Frame buffers are recycled; enough exist to cover every frame queued
+        # for the encoder, the one being encoded and the one being drawn
+        buffers = [np.empty((height, width, 3), dtype=np.uint8)
+                   for _ in range(self.ENCODE_QUEUE_SIZE + 2)]
+
+        # The text is rasterized once per clip rather than kept on this shared generator
+        text_template = self._build_text_template(prompt, width, height)
+
+        # Create animated frames based on prompt and style
+        frames = (
+            self._create_animated_frame(prompt, style, i, total_frames, width, height,
+                                        out=buffers[i % len(buffers)], text_template=text_template)
+            for i in range(start, stop)
+        )
+        self._encode_frames(video_path, fps, width, height, frames)
+
+    def _generate_local_video_parallel(self, video_path, ffmpeg: str, num_segments: int,
+                                       prompt: str, style: str, total_frames: int,
+                                       fps: int, width: int, height: int):
+        """Render time segments in separate processes and join them with ffmpeg"""
+        # Frames depend only on their index, so segments can be rendered independently
+        chunk = math.ceil(total_frames / num_segments)
+        segment_id = uuid.uuid4().hex[:8]
+        segments = []
+        for k in range(num_segments):
+            start, stop = k * chunk, min((k + 1) * chunk, total_frames)
+            if start >= stop:
+                break
+            segment_path = str(self.config.TEMP_DIR / f"segment_{segment_id}_{k}.mp4")
+            segments.append((segment_path, prompt, style, start, stop, total_frames, fps, width, height))
+
+        list_path = self.config.TEMP_DIR / f"segments_{segment_id}.txt"
+        try:
+            # Forking a threaded server process (possibly with CUDA initialised) can
+            # deadlock the children, so workers start from a fresh interpreter
+            with multiprocessing.get_context("spawn").Pool(len(segments)) as pool:
+                segment_paths = pool.map(_render_video_segment, segments)
+
+            # Concatenate with stream copy; no re-encoding is needed
+            with open(list_path, 'w') as f:
+                f.write("".join(f"file '{path}'\n" for path in segment_paths))
+            subprocess.run(
+                [ffmpeg, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0",
+                 "-i", str(list_path), "-c", "copy", str(video_path)],
+                check=True, capture_output=True
+            )
+        finally:
+            for segment in segments:
+                Path(segment[0]).unlink(missing_ok=True)
+            list_path.unlink(missing_ok=True)
+
+    def _find_ffmpeg(self) -> Optional[str]:
+        """Locate an ffmpeg binary, preferring the one bundled with moviepy"""
+        try:
+            import imageio_ffmpeg
+            return imageio_ffmpeg.get_ffmpeg_exe()
+        except Exception:
+            return shutil.which("ffmpeg")
+
+    def _encode_frames(self, video_path, fps: int, width: int, height: int, frames):
+        """Encode frames to an mp4 on a background thread while they are still being produced"""
+        codec = _select_h264_encoder() if AV_AVAILABLE else None
+        if codec:
+            write, close = self._open_av_writer(video_path, codec, fps, width, height)
+        else:
+            write, close = self._open_cv2_writer(video_path, fps, width, height)
+
+        frame_queue = queue.Queue(maxsize=self.ENCODE_QUEUE_SIZE)
+        errors = []
+
+        def _encoder_worker():
+            # Keep draining after a failure so the producer never blocks on a full queue
+            while True:
+                frame = frame_queue.get()
+                if frame is None:
+                    break
+                if not errors:
+                    try:
+                        write(frame)
+                    except Exception as e:
+                        errors.append(e)
+
+        # Drawing and encoding both release the GIL, so the two stages overlap
+        encoder = threading.Thread(target=_encoder_worker, daemon=True)
+        encoder.start()
+        try:
+            for frame in frames:
+                if errors:
+                    break
+                frame_queue.put(frame)
+        finally:
+            frame_queue.put(None)
+            encoder.join()
+            close()
+
+        if errors:
+            raise errors[0]
+
+    def _open_av_writer(self, video_path, codec: str, fps: int, width: int, height: int):
+        """Open an H.264 mp4 writer through PyAV, returning its write and close functions"""
+        import av
+
+        container = av.open(str(video_path), mode='w')
+        stream = container.add_stream(codec, rate=fps)
+        stream.width, stream.height = width, height
+        stream.pix_fmt = 'yuv420p'
+        if codec == "libx264":
+            stream.options = {"preset": "ultrafast"}
+
+        def write(frame):
+            # from_ndarray copies the frame, so recycled buffers are safe to reuse
+            for packet in stream.encode(av.VideoFrame.from_ndarray(frame, format='bgr24')):
+                container.mux(packet)
+
+        def close():
+            try:
+                # Flush frames still buffered inside the encoder
+                for packet in stream.encode():
+                    container.mux(packet)
+            finally:
+                container.close()
+
+        return write, close
+
+    def _open_cv2_writer(self, video_path, fps: int, width: int, height: int):
+        """Open an MPEG-4 mp4 writer through OpenCV, returning its write and close functions"""
+        import cv2
+
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        out = cv2.VideoWriter(str(video_path), fourcc, fps, (width, height))
+        return out.write, out.release
+
     def _image_to_video_runwayml(self, image_path: str, motion_prompt: str, duration: int) -> str:
         """Convert image to video using RunwayML (placeholder)"""
         return self._image_to_video_local(image_path, motion_prompt, duration, 24, "1080p")
@@ -103,6 +277,9 @@ class VideoGenerator:
         if not CV2_AVAILABLE:
             return self._generate_placeholder_video(motion_prompt, duration, fps, resolution, "Image2Video")
 
+        import cv2
+        import numpy as np
+
         try:
             # Load base image
             base_image = cv2.imread(image_path)
@@ -113,27 +290,26 @@ class VideoGenerator:
             width, height = self._get_resolution_dimensions(resolution)
             base_image = cv2.resize(base_image, (width, height))
 
-            # Create animated frames with motion effects
-            frames = []
             total_frames = duration * fps
 
-            for i in range(total_frames):
-                # Apply motion effects based on motion_prompt
-                frame = self._apply_motion_effects(base_image, motion_prompt, i, total_frames)
-                frames.append(frame)
+            # Resolve the effect and its per-frame strength once for the whole clip
+            mode = self._get_motion_mode(motion_prompt)
+            schedule = self._get_motion_schedule(mode, total_frames, width, height)
 
-            # Create video from frames
             timestamp = int(time.time())
             video_path = self.config.VIDEOS_DIR / f"i2v_local_{timestamp}.mp4"
 
-            # Write video using OpenCV
-            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-            out = cv2.VideoWriter(str(video_path), fourcc, fps, (width, height))
-
-            for frame in frames:
-                out.write(frame)
+            # The wave grid is built per clip rather than kept on this shared generator
+            wave_grid = self._build_wave_grid(height, width) if mode == "wave" else None
 
-            out.release()
+            # Effects write into recycled output buffers, sized like the text-to-video ring
+            buffers = [np.empty_like(base_image) for _ in range(self.ENCODE_QUEUE_SIZE + 2)]
+            frames = (
+                self._apply_motion_effects(base_image, mode, schedule[i], out=buffers[i % len(buffers)],
+                                           wave_grid=wave_grid)
+                for i in range(total_frames)
+            )
+            self._encode_frames(video_path, fps, width, height, frames)
 
             return str(video_path)
 
@@ -148,15 +324,19 @@ class VideoGenerator:
             timestamp = int(time.time())
             video_path = self.config.VIDEOS_DIR / f"placeholder_video_{timestamp}.txt"
 
+            content = (
+                f"Video Placeholder\n"
+                f"Prompt: {prompt}\n"
+                f"Duration: {duration}s\n"
+                f"FPS: {fps}\n"
+                f"Resolution: {resolution}\n"
+                f"Style: {style}\n"
+                f"Generated: {datetime.now()}\n"
+                "\nNote: This is a placeholder. Install cv2 and moviepy for actual video generation."
+            )
+
             with open(video_path, 'w') as f:
-                f.write(f"Video Placeholder\n")
-                f.write(f"Prompt: {prompt}\n")
-                f.write(f"Duration: {duration}s\n")
-                f.write(f"FPS: {fps}\n")
-                f.write(f"Resolution: {resolution}\n")
-                f.write(f"Style: {style}\n")
-                f.write(f"Generated: {datetime.now()}\n")
-                f.write("\nNote: This is a placeholder. Install cv2 and moviepy for actual video generation.")
+                f.write(content)
 
             return str(video_path)
 
@@ -165,74 +345,125 @@ class VideoGenerator:
 
     def _get_resolution_dimensions(self, resolution: str) -> tuple:
         """Get width and height for a resolution string"""
-        resolution_map = {
-            "720p": (1280, 720),
-            "1080p": (1920, 1080),
-            "4K": (3840, 2160),
-            "square": (1024, 1024)
-        }
-        return resolution_map.get(resolution, (1920, 1080))
+        return self.RESOLUTION_MAP.get(resolution, (1920, 1080))
 
     def _create_animated_frame(self, prompt: str, style: str, frame_num: int, 
-                              total_frames: int, width: int, height: int):
-        """Create an animated frame based on prompt and style"""
+                              total_frames: int, width: int, height: int, out=None,
+                              text_template=None):
+        """Create an animated frame based on prompt and style, drawing into out if given"""
         if not CV2_AVAILABLE:
             return None
 
-        # Create a simple animated frame
-        frame = np.zeros((height, width, 3), dtype=np.uint8)
+        import cv2
+        import numpy as np
+
+        # Start from the pre-rendered text so glyphs are rasterized once per clip
+        template = (text_template if text_template is not None
+                    else self._build_text_template(prompt, width, height))
+        if out is None:
+            frame = template.copy()
+        else:
+            frame = out
+            np.copyto(frame, template)
 
         # Animate based on frame number
         progress = frame_num / total_frames
 
         # Create moving elements
-        center_x = int(width/2 + np.sin(progress * 2 * np.pi) * width/4)
-        center_y = int(height/2 + np.cos(progress * 2 * np.pi) * height/4)
+        center_x = int(width/2 + math.sin(progress * 2 * math.pi) * width/4)
+        center_y = int(height/2 + math.cos(progress * 2 * math.pi) * height/4)
 
         # Draw animated circle
         cv2.circle(frame, (center_x, center_y), 50, (255, 255, 255), -1)
 
-        # Add text based on prompt
-        cv2.putText(frame, prompt[:30], (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 
-                   1, (255, 255, 255), 2)
-
         return frame
 
-    def _apply_motion_effects(self, base_image, motion_prompt: str, 
-                             frame_num: int, total_frames: int):
-        """Apply motion effects to base image"""
-        if not CV2_AVAILABLE:
-            return base_image
-
-        frame = base_image.copy()
-        progress = frame_num / total_frames
+    def _build_text_template(self, prompt: str, width: int, height: int):
+        """Build a black frame with the prompt text drawn"""
+        import cv2
+        import numpy as np
 
-        # Apply different motion effects based on prompt
-        if "zoom" in motion_prompt.lower():
-            # Zoom effect
-            scale = 1.0 + 0.2 * progress
-            center = (base_image.shape[1]//2, base_image.shape[0]//2)
-            matrix = cv2.getRotationMatrix2D(center, 0, scale)
-            frame = cv2.warpAffine(frame, matrix, (base_image.shape[1], base_image.shape[0]))
-
-        elif "wave" in motion_prompt.lower():
-            # Wave effect
-            rows, cols = frame.shape[:2]
-            wave_amp = 20 * np.sin(progress * 2 * np.pi)
-
-            for i in range(0, rows, 4):  # Skip some rows for performance
-                for j in range(0, cols, 4):  # Skip some columns for performance
-                    offset_x = int(wave_amp * np.sin(2 * np.pi * i / 50))
-                    offset_y = int(wave_amp * np.sin(2 * np.pi * j / 50))
-
-                    if 0 <= i + offset_y < rows and 0 <= j + offset_x < cols:
-                        frame[i, j] = base_image[i + offset_y, j + offset_x]
-
-        elif "rotate" in motion_prompt.lower():
-            # Rotation effect
-            angle = 360 * progress
-            center = (base_image.shape[1]//2, base_image.shape[0]//2)
-            matrix = cv2.getRotationMatrix2D(center, angle, 1.0)
-            frame = cv2.warpAffine(frame, matrix, (base_image.shape[1], base_image.shape[0]))
+        template = np.zeros((height, width, 3), dtype=np.uint8)
+        cv2.putText(template, prompt[:30], (50, 50), cv2.FONT_HERSHEY_SIMPLEX,
+                   1, (255, 255, 255), 2)
+        return template
+
+    def _get_motion_mode(self, motion_prompt: str) -> Optional[str]:
+        """Pick the motion effect named in the prompt"""
+        prompt = motion_prompt.lower()
+        for mode in ("zoom", "wave", "rotate"):
+            if mode in prompt:
+                return mode
+        return None
+
+    def _get_motion_schedule(self, mode: Optional[str], total_frames: int, width: int, height: int):
+        """Compute the per-frame effect parameters for a whole clip"""
+        import numpy as np
+
+        progress = np.arange(total_frames, dtype=np.float64) / total_frames
+
+        if mode == "zoom":
+            return self._get_affine_schedule(np.zeros(total_frames), 1.0 + 0.2 * progress,
+                                             width, height)
+        elif mode == "wave":
+            return 20 * np.sin(progress * 2 * np.pi)  # wave amplitude
+        elif mode == "rotate":
+            return self._get_affine_schedule(360 * progress, np.ones(total_frames),
+                                             width, height)
+        return np.zeros(total_frames)
+
+    def _get_affine_schedule(self, angles, scales, width: int, height: int):
+        """Build one getRotationMatrix2D-equivalent matrix per frame about the frame center"""
+        import numpy as np
+
+        cx, cy = width // 2, height // 2
+        angles_rad = np.deg2rad(angles)
+        alpha = scales * np.cos(angles_rad)
+        beta = scales * np.sin(angles_rad)
+
+        matrices = np.empty((len(angles), 2, 3), dtype=np.float64)
+        matrices[:, 0, 0] = alpha
+        matrices[:, 0, 1] = beta
+        matrices[:, 0, 2] = (1 - alpha) * cx - beta * cy
+        matrices[:, 1, 0] = -beta
+        matrices[:, 1, 1] = alpha
+        matrices[:, 1, 2] = beta * cx + (1 - alpha) * cy
+        return matrices
+
+    def _apply_motion_effects(self, base_image, mode: Optional[str], params, out=None, wave_grid=None):
+        """Apply a motion effect with the given frame parameters to base image, writing into out if given"""
+        if not CV2_AVAILABLE or mode is None:
+            return base_image
 
-        return frame
+        import cv2
+        import numpy as np
+
+        rows, cols = base_image.shape[:2]
+
+        # warpAffine and remap read the base image and write out (or a new buffer),
+        # so the base image is never copied
+        if mode in ("zoom", "rotate"):
+            # Zoom and rotation effects: params is this frame's precomputed 2x3 matrix
+            return cv2.warpAffine(base_image, params, (cols, rows), dst=out)
+
+        elif mode == "wave":
+            # Wave effect: shift each row horizontally and each column vertically.
+            # Nearest-neighbour sampling copies source pixels as-is, and the border
+            # mode handles out-of-range coordinates without per-pixel bounds checks
+            ii, jj, sin_i, sin_j = wave_grid if wave_grid is not None else self._build_wave_grid(rows, cols)
+            map_x = jj + np.float32(params) * sin_i
+            map_y = ii + np.float32(params) * sin_j
+            return cv2.remap(base_image, map_x, map_y, cv2.INTER_NEAREST,
+                             dst=out, borderMode=cv2.BORDER_REFLECT)
+
+        return base_image
+
+    def _build_wave_grid(self, rows: int, cols: int) -> tuple:
+        """Build pixel coordinate grids and their wave offsets for a frame size"""
+        import numpy as np
+
+        ii, jj = np.meshgrid(np.arange(rows, dtype=np.float32),
+                             np.arange(cols, dtype=np.float32), indexing='ij')
+        sin_i = np.sin(2 * np.pi * ii / 50).astype(np.float32)
+        sin_j = np.sin(2 * np.pi * jj / 50).astype(np.float32)
+        return ii, jj, sin_i, sin_j
@@ -1,9 +1,32 @@
 import streamlit as st
+import io
+import os
 from typing import Dict, Any
+from types import MappingProxyType
+from PIL import Image
+
+@st.cache_data(max_entries=128, show_spinner=False)
+def get_thumbnail(path: str, mtime: float, width: int = 512) -> bytes:
+    """Downscale an image to PNG bytes, re-encoded only when the file's mtime changes"""
+    with Image.open(path) as img:
+        img.thumbnail((width, width))
+        buf = io.BytesIO()
+        img.save(buf, "PNG")
+    return buf.getvalue()
 
 class UIComponents:
     """UI components for the AI Media Generator"""
 
+    # Media kind of each file extension shown in the file grid
+    FILE_KINDS = MappingProxyType({
+        ".png": "image",
+        ".jpg": "image",
+        ".jpeg": "image",
+        ".mp4": "video",
+        ".avi": "video",
+        ".mov": "video"
+    })
+
     def __init__(self):
         pass
 
@@ -42,9 +65,13 @@ class UIComponents:
 
         for i, file_path in enumerate(files):
             with cols[i % columns]:
-                if file_path.lower().endswith(('.png', '.jpg', '.jpeg')):
-                    st.image(file_path, use_column_width=True)
-                elif file_path.lower().endswith(('.mp4', '.avi', '.mov')):
+                # Only the short extension is lowercased, then matched with one lookup
+                kind = self.FILE_KINDS.get(os.path.splitext(file_path)[1].lower())
+                if kind == "image":
+                    # Send a cached downscaled copy instead of the full-resolution file
+                    st.image(get_thumbnail(file_path, os.path.getmtime(file_path), 256),
+                             use_column_width=True)
+                elif kind == "video":
                     st.video(file_path)
                 else:
                     st.write(f"File: {file_path}")
@@ -87,19 +114,26 @@ class UIComponents:
                 st.error(f"❌ {api_name} - Not Available")
 
     def render_generation_history(self, history: list, max_items: int = 10):
-        """Render generation history"""
+        """Render generation history, newest first"""
+        st.subheader("📚 Generation History")
+
         if not history:
-            st.info("No generation history available")
+            st.info("No generations yet. Start creating!")
             return
 
-        st.subheader("Recent Generations")
-
-        for i, item in enumerate(history[-max_items:]):
+        for i, item in enumerate(reversed(history[-max_items:])):
             with st.expander(f"{item.get('type', 'Unknown')} - {item.get('timestamp', 'Unknown')}", expanded=i==0):
                 st.write(f"**Prompt:** {item.get('prompt', 'N/A')}")
                 st.write(f"**Provider:** {item.get('provider', 'N/A')}")
 
-                if item.get('path') and item.get('type') == 'Image':
-                    st.image(item['path'], use_column_width=True)
-                elif item.get('path') and item.get('type') == 'Video':
-                    st.video(item['path'])
+                path = item.get('path')
+                if not path:
+                    continue
+                if item.get('type') == 'Image':
+                    if os.path.exists(path):
+                        st.image(get_thumbnail(path, os.path.getmtime(path), 320), use_column_width=True)
+                    else:
+                        st.image(path, use_column_width=True)
+                else:
+                    # Video and Image to Video entries both point at a video file
+                    st.video(path)
@@ -1,16 +1,14 @@
 import os
 import shutil
+import time
 import tempfile
+import importlib.util
 from pathlib import Path
 from typing import Optional
-import uuid
 from datetime import datetime
 
-try:
-    from PIL import Image
-    PIL_AVAILABLE = True
-except ImportError:
-    PIL_AVAILABLE = False
+# PIL is only needed for objects that are already PIL images, so just check it is installed
+PIL_AVAILABLE = importlib.util.find_spec("PIL") is not None
 
 class FileManager:
     """Handles file operations for the AI Media Generator"""
@@ -30,29 +28,50 @@ class FileManager:
     def save_image(self, image, filename: Optional[str] = None) -> str:
         """Save image to the images directory"""
         if filename is None:
-            filename = f"image_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{str(uuid.uuid4())[:8]}.png"
+            filename = f"image_{time.time_ns()}_{os.urandom(4).hex()}.png"
 
         filepath = self.images_dir / filename
 
         if PIL_AVAILABLE and hasattr(image, 'save'):
-            image.save(filepath, "PNG")
+            # Generated images are opaque; dropping alpha shrinks the file by a quarter
+            if image.mode == "RGBA":
+                image = image.convert("RGB")
+            # Fast zlib level: these are gallery artifacts, not archival output
+            image.save(filepath, "PNG", compress_level=1, optimize=False)
         else:
             # Handle as file path or binary data
             if isinstance(image, str):
-                shutil.copy2(image, filepath)
+                # A hard link costs no I/O; fall back to a copy across devices or
+                # on filesystems without link support
+                try:
+                    os.link(image, filepath)
+                except OSError:
+                    shutil.copyfile(image, filepath)
             else:
                 with open(filepath, 'wb') as f:
                     f.write(image)
 
         return str(filepath)
 
-    def save_video(self, video_path: str, filename: Optional[str] = None) -> str:
-        """Save video to the videos directory"""
+    def save_video(self, video_path: str, filename: Optional[str] = None, move: bool = False) -> str:
+        """Save video to the videos directory, moving instead of copying when move is set"""
         if filename is None:
-            filename = f"video_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{str(uuid.uuid4())[:8]}.mp4"
+            filename = f"video_{time.time_ns()}_{os.urandom(4).hex()}.mp4"
 
         destination = self.videos_dir / filename
-        shutil.copy2(video_path, destination)
+
+        if move:
+            # A rename is O(1) on the same filesystem; fall back to copy + delete across devices
+            try:
+                os.replace(video_path, destination)
+                return str(destination)
+            except OSError:
+                pass
+
+        # copyfile uses the kernel's zero-copy path where available and skips the metadata copy
+        shutil.copyfile(video_path, destination)
+        if move:
+            os.unlink(video_path)
         return str(destination)
 
     def save_temp_file(self, uploaded_file) -> str:
@@ -60,35 +79,40 @@ class FileManager:
         filename = f"temp_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uploaded_file.name}"
         filepath = self.temp_dir / filename
 
+        # Copy in 1 MB chunks so large uploads are never held in memory at once
         with open(filepath, 'wb') as f:
-            f.write(uploaded_file.read())
+            shutil.copyfileobj(uploaded_file, f, length=1024 * 1024)
 
         return str(filepath)
 
     def cleanup_temp_files(self, max_age_hours: int = 24):
         """Clean up temporary files older than max_age_hours"""
-        import time
-
-        current_time = time.time()
-        max_age_seconds = max_age_hours * 3600
+        cutoff = time.time() - max_age_hours * 3600
 
-        for file_path in self.temp_dir.glob("*"):
-            if file_path.is_file():
-                file_age = current_time - file_path.stat().st_mtime
-                if file_age > max_age_seconds:
-                    file_path.unlink()
+        with os.scandir(self.temp_dir) as it:
+            for entry in it:
+                if entry.is_file(follow_symlinks=False) and entry.stat().st_mtime < cutoff:
+                    os.unlink(entry.path)
 
     def get_generated_files(self, file_type: str = "all") -> list:
         """Get list of generated files"""
-        files = []
+        directories = []
 
         if file_type in ["all", "images"]:
-            files.extend([str(f) for f in self.images_dir.glob("*.*")])
+            directories.append(self.images_dir)
 
         if file_type in ["all", "videos"]:
-            files.extend([str(f) for f in self.videos_dir.glob("*.*")])
+            directories.append(self.videos_dir)
+
+        # DirEntry caches its stat result, so each file is stat'ed only once
+        entries = []
+        for directory in directories:
+            with os.scandir(directory) as it:
+                entries.extend((entry.path, entry.stat().st_mtime)
+                               for entry in it if "." in entry.name and entry.is_file())
 
-        return sorted(files, key=lambda x: os.path.getmtime(x), reverse=True)
+        entries.sort(key=lambda entry: entry[1], reverse=True)
+        return [path for path, _ in entries]
 
     def delete_file(self, filepath: str) -> bool:
         """Delete a file safely"""